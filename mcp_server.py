@@ -17,23 +17,216 @@ Or with uvicorn:
     uvicorn mcp_server:app --host 0.0.0.0 --port 8000
 """
 
-from typing import Optional
+import io
+import sys
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+import numpy as np
 from mcp.server.fastmcp import FastMCP
 
-from physics_knowledge_db import PhysicsKnowledgeBase
+from physics_knowledge_db import PhysicsKnowledgeBase, QueryResultColumns
+from semantic_cache import SemanticQueryCache
 
 
 # Initialize the MCP server
 mcp = FastMCP("physics-agent")
 
-# Initialize the knowledge base (singleton instance)
-print("Initializing Physics Knowledge Base...")
-knowledge_base = PhysicsKnowledgeBase(db_path="./db")
-print("Physics Knowledge Base ready!")
+# The knowledge base (singleton instance) is created lazily so the server can
+# start accepting requests before the embedding model has finished loading
+_knowledge_base: Optional[PhysicsKnowledgeBase] = None
+_knowledge_base_lock = threading.Lock()
+
+
+def get_kb() -> PhysicsKnowledgeBase:
+    """
+    Get the shared PhysicsKnowledgeBase, initializing it on first use.
+
+    Returns:
+        The PhysicsKnowledgeBase singleton.
+    """
+    global _knowledge_base
+    
+    if _knowledge_base is None:
+        with _knowledge_base_lock:
+            if _knowledge_base is None:
+                # Log to stderr: this may run on the warm-up thread while the stdio
+                # transport is already using stdout for JSON-RPC messages
+                print("Initializing Physics Knowledge Base...", file=sys.stderr)
+                _knowledge_base = PhysicsKnowledgeBase(db_path="./db")
+                print("Physics Knowledge Base ready!", file=sys.stderr)
+    
+    return _knowledge_base
+
+
+# Separator lines shared by the tool output formatters
+_SEP_EQ60 = "=" * 60
+_SEP_DASH60 = "-" * 60
+_SEP_EQ40 = "=" * 40
+_SEP_DASH40 = "-" * 40
+
+# Number of characters shown from passages and code snippets
+_PREVIEW_LEN = 500
+_SHORT_PREVIEW_LEN = 400
+
+# Static checklist appended to every code critique
+_REFACTOR_SUGGESTIONS = """
+Based on the retrieved context, consider checking:
+
+1. **Loss Function**: Does your loss match the paper's equation?
+   - Check normalization (mean vs sum)
+   - Check coefficient values
+
+2. **Data Preprocessing**: Are you normalizing inputs correctly?
+   - Many physics methods expect specific input ranges
+
+3. **Output Scaling**: Is your output in the expected range?
+   - Light directions often need normalization
+
+4. **Numerical Stability**: Are you handling edge cases?
+   - Division by zero, very small values, etc.
+
+Use 'verify_source' with the Paper ID to access the full paper for detailed verification.
+
+"""
+
+
+def _result_rows(results: QueryResultColumns) -> Iterator[Tuple[str, str, int, str, str]]:
+    """Iterate over (title, source_id, page, url, text) rows of column-oriented results."""
+    return zip(results.titles, results.source_ids, results.pages, results.urls, results.texts)
+
+
+
+def _unseen_rows(
+    results: QueryResultColumns,
+    shown_texts: Set[str],
+    n_results: int
+) -> QueryResultColumns:
+    """
+    Keep the first n_results rows whose text has not been shown yet.
+
+    Args:
+        results: Candidate rows, best match first.
+        shown_texts: Texts already included in the report.
+        n_results: Maximum number of rows to keep.
+
+    Returns:
+        QueryResultColumns with at most n_results unseen rows.
+    """
+    return results.select(
+        [i for i, text in enumerate(results.texts) if text not in shown_texts]
+    )[:n_results]
+
+
+# Metadata filter for chunks ingested from GitHub READMEs and requirements files
+IMPLEMENTATION_FILTER = {"type": "implementation_details"}
+
+
+def _implementation_filter(source_ids: List[str]) -> Dict[str, Any]:
+    """
+    Build a metadata filter for GitHub content belonging to the given papers.
+
+    Args:
+        source_ids: ArXiv paper IDs whose repositories may be returned.
+
+    Returns:
+        A ChromaDB where clause.
+    """
+    return {"$and": [IMPLEMENTATION_FILTER, {"source_id": {"$in": source_ids}}]}
+
+# Paper ID -> reference; paper metadata never changes once ingested
+_ref_cache: Dict[str, Dict[str, str]] = {}
+
+# Cache query results so repeated (or near-identical) questions skip the vector search
+query_cache = SemanticQueryCache(
+    embed_fn=lambda texts: get_kb().embed_queries(texts),
+    max_size=2000,
+    similarity_threshold=0.95
+)
+
+# Every cached query fetches at least this many results; callers slice what they need,
+# so one cached retrieval serves requests with any smaller n_results
+KB_OVERFETCH_K = 10
+
+
+def _cached_query_batch(
+    questions: List[str],
+    n_results: int,
+    where: Optional[Dict[str, Any]] = None,
+    semantic: bool = True,
+    embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None
+) -> List[QueryResultColumns]:
+    """
+    Query the knowledge base through the semantic cache.
+
+    Args:
+        questions: The questions to search for.
+        n_results: Number of results to return per question.
+        where: Optional ChromaDB metadata filter.
+        semantic: Whether near-identical cached questions may answer these ones.
+        embed_fn: Embedding function to use on cache misses (defaults to the KB's).
+
+    Returns:
+        One QueryResultColumns per question.
+    """
+    k = max(n_results, KB_OVERFETCH_K)
+    batches = query_cache.get_or_compute_many(
+        questions,
+        k,
+        lambda queries, embeddings: get_kb().query_physics_db_soa_batch(
+            queries, n_results=k, query_embeddings=embeddings, where=where
+        ),
+        where=where,
+        semantic=semantic,
+        embed_fn=embed_fn
+    )
+    return [results[:n_results] for results in batches]
+
+
+def _cached_query(
+    question: str,
+    n_results: int,
+    where: Optional[Dict[str, Any]] = None,
+    semantic: bool = True,
+    embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None
+) -> QueryResultColumns:
+    """
+    Query the knowledge base for a single question through the semantic cache.
+
+    Args:
+        question: The question to search for.
+        n_results: Number of results to return.
+        where: Optional ChromaDB metadata filter.
+        semantic: Whether near-identical cached questions may answer this one.
+        embed_fn: Embedding function to use on cache misses (defaults to the KB's).
+
+    Returns:
+        QueryResultColumns for the question.
+    """
+    return _cached_query_batch(
+        [question], n_results, where=where, semantic=semantic, embed_fn=embed_fn
+    )[0]
+
+
+def _shared_embedder() -> Callable[[List[str]], np.ndarray]:
+    """
+    Create an embedding function that encodes each distinct text at most once.
+
+    Returns:
+        A function mapping a list of texts to an (N, D) embedding array.
+    """
+    embedded: Dict[str, np.ndarray] = {}
+    
+    def embed(texts: List[str]) -> np.ndarray:
+        missing = [text for text in dict.fromkeys(texts) if text not in embedded]
+        if missing:
+            embedded.update(zip(missing, get_kb().embed_queries(missing)))
+        return np.stack([embedded[text] for text in texts])
+    
+    return embed
 
 
 @mcp.tool()
-def add_knowledge_topic(topic: str, max_papers: int = 5) -> str:
+def add_knowledge_topic(topic: str, max_papers: int = 5, reingest: bool = False) -> str:
     """
     Downloads and studies physics papers related to a specific topic from ArXiv.
     
@@ -46,14 +239,21 @@ def add_knowledge_topic(topic: str, max_papers: int = 5) -> str:
     Args:
         topic: The physics topic to search for on ArXiv (e.g., 'Lambertian Reflectance', 'Shadow Analysis')
         max_papers: Maximum number of papers to download and process (default: 5)
+        reingest: Re-process papers that are already in the knowledge base (default: False)
     
     Returns:
         A summary of the ingestion process including number of chunks stored.
     """
     try:
-        total_chunks = knowledge_base.crawl_physics_knowledge(topic, max_papers=max_papers)
+        total_chunks = get_kb().crawl_physics_knowledge(
+            topic, max_papers=max_papers, reingest=reingest
+        )
+        
+        # New papers can change any answer, so drop all cached query results
+        query_cache.clear()
+        _ref_cache.clear()
         
-        stats = knowledge_base.get_collection_stats()
+        stats = get_kb().get_collection_stats()
         
         return (
             f"✅ Successfully ingested papers on topic: '{topic}'\n"
@@ -65,6 +265,43 @@ def add_knowledge_topic(topic: str, max_papers: int = 5) -> str:
         return f"❌ Error ingesting papers: {str(e)}"
 
 
+def _format_passage(
+    index: int,
+    title: str,
+    source_id: str,
+    page: int,
+    text: str,
+    relevance: float
+) -> str:
+    """
+    Format a single query result as a cited passage block.
+
+    Args:
+        index: 1-based position of the result.
+        title: Source title.
+        source_id: ArXiv paper ID.
+        page: Page number.
+        text: Passage text.
+        relevance: Relevance score (1 - distance).
+
+    Returns:
+        The passage block as one multi-line string.
+    """
+    
+    # Truncate text for readability
+    display_text = text if len(text) <= _PREVIEW_LEN else text[:_PREVIEW_LEN] + "..."
+    
+    return (
+        f"📖 [{index}] PASSAGE\n"
+        f"   Source: {title}\n"
+        f"   Paper ID: {source_id}\n"
+        f"   Page: {page}\n"
+        f"   Relevance Score: {relevance:.3f}\n"
+        f"   \n   \"{display_text}\"\n"
+        f"{_SEP_DASH60}"
+    )
+
+
 @mcp.tool()
 def consult_physics_expert(question: str, n_results: int = 3) -> str:
     """
@@ -82,7 +319,7 @@ def consult_physics_expert(question: str, n_results: int = 3) -> str:
         Relevant text snippets with source citations (paper title, ID, and page number).
     """
     try:
-        results = knowledge_base.query_physics_db(question, n_results=n_results)
+        results = _cached_query(question, n_results)
         
         if not results:
             return (
@@ -93,27 +330,16 @@ def consult_physics_expert(question: str, n_results: int = 3) -> str:
         # Format output with citations
         output_parts = [
             f"🔍 Found {len(results)} relevant passages for: \"{question}\"\n",
-            "=" * 60,
+            _SEP_EQ60,
             ""
         ]
         
-        for i, result in enumerate(results, 1):
-            source_id = result.get('source_id', 'Unknown')
-            title = result.get('title', 'Unknown Title')
-            page = result.get('page', 'N/A')
-            text = result.get('text', '')
-            distance = result.get('distance', 0)
-            
-            # Truncate text for readability
-            display_text = text[:500] + "..." if len(text) > 500 else text
-            
-            output_parts.append(f"📖 [{i}] PASSAGE")
-            output_parts.append(f"   Source: {title}")
-            output_parts.append(f"   Paper ID: {source_id}")
-            output_parts.append(f"   Page: {page}")
-            output_parts.append(f"   Relevance Score: {1 - distance:.3f}")
-            output_parts.append(f"   \n   \"{display_text}\"")
-            output_parts.append("-" * 60)
+        output_parts.extend(
+            _format_passage(i, title, source_id, page, text, relevance)
+            for i, ((title, source_id, page, _, text), relevance) in enumerate(
+                zip(_result_rows(results), 1 - results.distances), 1
+            )
+        )
         
         output_parts.append("\n💡 Use 'verify_source' with the Paper ID to get the full citation details.")
         
@@ -138,7 +364,12 @@ def verify_source(paper_id: str) -> str:
         Full paper details including title and URL for verification.
     """
     try:
-        reference = knowledge_base.get_reference(paper_id)
+        reference = _ref_cache.get(paper_id)
+        if reference is None:
+            reference = get_kb().get_reference(paper_id)
+            # Only cache hits, so papers ingested later are still found
+            if reference:
+                _ref_cache[paper_id] = reference
         
         if not reference:
             return (
@@ -151,11 +382,11 @@ def verify_source(paper_id: str) -> str:
         
         return (
             f"📄 PAPER REFERENCE\n"
-            f"{'=' * 60}\n"
+            f"{_SEP_EQ60}\n"
             f"📌 Paper ID: {paper_id}\n"
             f"📚 Title: {title}\n"
             f"🔗 URL: {url}\n"
-            f"{'=' * 60}\n\n"
+            f"{_SEP_EQ60}\n\n"
             f"You can access the full paper at the URL above for verification."
         )
         
@@ -174,14 +405,17 @@ def get_knowledge_stats() -> str:
         Statistics about the knowledge base.
     """
     try:
-        stats = knowledge_base.get_collection_stats()
+        stats = get_kb().get_collection_stats()
+        cache_stats = query_cache.get_stats()
         
         return (
             f"📊 KNOWLEDGE BASE STATISTICS\n"
-            f"{'=' * 40}\n"
+            f"{_SEP_EQ40}\n"
             f"📚 Total text chunks: {stats.get('total_chunks', 0)}\n"
             f"🗂️  Collection name: {stats.get('collection_name', 'N/A')}\n"
-            f"{'=' * 40}"
+            f"⚡ Cached queries: {cache_stats['size']} "
+            f"(hit rate: {cache_stats['hit_rate']:.1%})\n"
+            f"{_SEP_EQ40}"
         )
         
     except Exception as e:
@@ -207,28 +441,46 @@ def critique_current_code_with_paper(current_code_snippet: str, topic_or_paper_i
         and Refactoring Suggestions.
     """
     try:
-        output_parts = [
-            f"🔬 CODE CRITIQUE REPORT",
-            f"{'=' * 60}",
-            f"📝 Analyzing code against paper theory and implementations",
-            f"🔍 Topic/Paper: {topic_or_paper_id}",
-            f"{'=' * 60}\n"
-        ]
+        theory_query = f"{topic_or_paper_id} formula equation mathematical definition loss function"
+        impl_query = f"{topic_or_paper_id} implementation code python pytorch"
+        
+        # The prompts differ only by topic_or_paper_id (e.g. two adjacent paper IDs),
+        # so near-identical prompts may mean different papers: cache them by exact text
         
-        # Query 1: Get theoretical/mathematical context
-        theory_results = knowledge_base.query_physics_db(
-            f"{topic_or_paper_id} formula equation mathematical definition loss function",
-            n_results=3
+        # Both lookups below use impl_query; on a cache miss it is only embedded once
+        embed = _shared_embedder()
+        
+        # Query 1: theoretical/mathematical context, batched with an unfiltered
+        # implementation query that serves as the fallback when there is no GitHub content
+        theory_candidates, paper_impl_candidates = _cached_query_batch(
+            [theory_query, impl_query], KB_OVERFETCH_K, semantic=False, embed_fn=embed
         )
+        theory_results = theory_candidates[:3]
         
-        # Query 2: Get implementation details (preferentially from GitHub)
-        impl_results = knowledge_base.query_physics_db(
-            f"{topic_or_paper_id} implementation code python pytorch",
-            n_results=3
+        # Query 2: implementation details, filtered in ChromaDB to GitHub content of the
+        # papers the topic matched; an unrestricted filter would return the nearest
+        # README in the whole database, however unrelated
+        topic_source_ids = sorted(
+            set(theory_candidates.source_ids) | set(paper_impl_candidates.source_ids)
         )
+        if topic_source_ids:
+            github_candidates = _cached_query(
+                impl_query, KB_OVERFETCH_K, _implementation_filter(topic_source_ids),
+                semantic=False, embed_fn=embed
+            )
+        else:
+            github_candidates = QueryResultColumns.empty()
         
-        # Also try to filter for implementation_details type if available
-        # (This is a semantic search, so we include keywords that would appear in READMEs)
+        # Both queries often hit the same chunk; only show it once, in the theory section.
+        # Dedup the over-fetched rows first so duplicates are replaced by the next match.
+        shown_texts = set(theory_results.texts)
+        github_results = _unseen_rows(github_candidates, shown_texts, 3)
+        impl_from_github = bool(github_results)
+        if impl_from_github:
+            impl_results = github_results
+        else:
+            impl_results = _unseen_rows(paper_impl_candidates, shown_texts, 3)
+        impl_all_shown = not impl_results and bool(github_candidates or paper_impl_candidates)
         
         if not theory_results and not impl_results:
             return (
@@ -237,88 +489,77 @@ def critique_current_code_with_paper(current_code_snippet: str, topic_or_paper_i
                 f"   Example: add_knowledge_topic('{topic_or_paper_id}')"
             )
         
+        # Write the report straight into one buffer; every line ends with "\n"
+        buf = io.StringIO()
+        w = buf.write
+        
+        w(f"🔬 CODE CRITIQUE REPORT\n"
+          f"{_SEP_EQ60}\n"
+          f"📝 Analyzing code against paper theory and implementations\n"
+          f"🔍 Topic/Paper: {topic_or_paper_id}\n"
+          f"{_SEP_EQ60}\n\n")
+        
         # === THEORY CHECK SECTION ===
-        output_parts.append("📐 THEORY CHECK")
-        output_parts.append("-" * 40)
+        w("📐 THEORY CHECK\n")
+        w(_SEP_DASH40 + "\n")
         
         if theory_results:
-            output_parts.append("Found theoretical context from papers:\n")
-            for i, result in enumerate(theory_results, 1):
-                title = result.get('title', 'Unknown')
-                source_id = result.get('source_id', 'Unknown')
-                page = result.get('page', 'N/A')
-                text = result.get('text', '')[:400]  # Truncate for readability
-                
-                output_parts.append(f"  [{i}] From: {title}")
-                output_parts.append(f"      Paper ID: {source_id}, Page: {page}")
-                output_parts.append(f"      \"{text}...\"\n")
+            w("Found theoretical context from papers:\n\n")
+            # Text is truncated for readability
+            for i, (title, source_id, page, _, text) in enumerate(
+                _result_rows(theory_results), 1
+            ):
+                w(f"  [{i}] From: {title}\n"
+                  f"      Paper ID: {source_id}, Page: {page}\n"
+                  f"      \"{text[:_SHORT_PREVIEW_LEN]}...\"\n\n")
             
-            output_parts.append("  ⚡ Compare your code against these formulas/definitions.")
-            output_parts.append("  ⚠️  Check: Are you implementing the math correctly?\n")
+            w("  ⚡ Compare your code against these formulas/definitions.\n")
+            w("  ⚠️  Check: Are you implementing the math correctly?\n\n")
         else:
-            output_parts.append("  ⚠️ No theoretical context found. Consider ingesting more papers.\n")
+            w("  ⚠️ No theoretical context found. Consider ingesting more papers.\n\n")
         
         # === REFERENCE IMPLEMENTATION SECTION ===
-        output_parts.append("\n🔧 REFERENCE IMPLEMENTATION")
-        output_parts.append("-" * 40)
-        
-        impl_with_github = [r for r in impl_results if "GitHub" in r.get('title', '') or 
-                           r.get('url', '').startswith('https://github.com')]
-        
-        if impl_with_github:
-            output_parts.append("Found implementation details from GitHub repositories:\n")
-            for i, result in enumerate(impl_with_github, 1):
-                title = result.get('title', 'Unknown')
-                url = result.get('url', '')
-                text = result.get('text', '')[:500]
-                
-                output_parts.append(f"  [{i}] From: {title}")
-                output_parts.append(f"      URL: {url}")
-                output_parts.append(f"      \"{text}...\"\n")
+        w("\n🔧 REFERENCE IMPLEMENTATION\n")
+        w(_SEP_DASH40 + "\n")
+        
+        if impl_from_github:
+            w("Found implementation details from GitHub repositories:\n\n")
+            for i, (title, _, _, url, text) in enumerate(
+                _result_rows(impl_results), 1
+            ):
+                w(f"  [{i}] From: {title}\n"
+                  f"      URL: {url}\n"
+                  f"      \"{text[:_PREVIEW_LEN]}...\"\n\n")
         elif impl_results:
-            output_parts.append("Found implementation context from papers:\n")
-            for i, result in enumerate(impl_results[:2], 1):
-                title = result.get('title', 'Unknown')
-                text = result.get('text', '')[:400]
-                output_parts.append(f"  [{i}] From: {title}")
-                output_parts.append(f"      \"{text}...\"\n")
+            w("Found implementation context from papers:\n\n")
+            for i, (title, _, _, _, text) in enumerate(
+                _result_rows(impl_results[:2]), 1
+            ):
+                w(f"  [{i}] From: {title}\n"
+                  f"      \"{text[:_SHORT_PREVIEW_LEN]}...\"\n\n")
+        elif impl_all_shown:
+            w("  ℹ️ The implementation matches are the passages already shown in THEORY CHECK.\n\n")
         else:
-            output_parts.append("  ⚠️ No implementation references found.\n")
+            w("  ⚠️ No implementation references found.\n\n")
         
         # === USER CODE ANALYSIS ===
-        output_parts.append("\n📋 YOUR CODE SNIPPET")
-        output_parts.append("-" * 40)
-        # Show first 500 chars of user code
-        code_preview = current_code_snippet[:500]
-        if len(current_code_snippet) > 500:
-            code_preview += "\n... (truncated)"
-        output_parts.append(f"```python\n{code_preview}\n```\n")
+        w("\n📋 YOUR CODE SNIPPET\n")
+        w(_SEP_DASH40 + "\n")
+        # Show the start of the user code
+        if len(current_code_snippet) <= _PREVIEW_LEN:
+            code_preview = current_code_snippet
+        else:
+            code_preview = current_code_snippet[:_PREVIEW_LEN] + "\n... (truncated)"
+        w(f"```python\n{code_preview}\n```\n\n")
         
         # === REFACTORING SUGGESTIONS ===
-        output_parts.append("\n💡 REFACTORING SUGGESTIONS")
-        output_parts.append("-" * 40)
-        output_parts.append("""
-Based on the retrieved context, consider checking:
-
-1. **Loss Function**: Does your loss match the paper's equation?
-   - Check normalization (mean vs sum)
-   - Check coefficient values
-
-2. **Data Preprocessing**: Are you normalizing inputs correctly?
-   - Many physics methods expect specific input ranges
-
-3. **Output Scaling**: Is your output in the expected range?
-   - Light directions often need normalization
-
-4. **Numerical Stability**: Are you handling edge cases?
-   - Division by zero, very small values, etc.
-
-Use 'verify_source' with the Paper ID to access the full paper for detailed verification.
-""")
+        w("\n💡 REFACTORING SUGGESTIONS\n")
+        w(_SEP_DASH40 + "\n")
+        w(_REFACTOR_SUGGESTIONS)
         
-        output_parts.append("=" * 60)
+        w(_SEP_EQ60)
         
-        return "\n".join(output_parts)
+        return buf.getvalue()
         
     except Exception as e:
         return f"❌ Error during code critique: {str(e)}"
@@ -337,5 +578,8 @@ if __name__ == "__main__":
     print("  5. critique_current_code_with_paper - Compare code against paper theory")
     print("\n" + "=" * 60 + "\n")
     
+    # Warm up the knowledge base in the background while the server starts
+    threading.Thread(target=get_kb, daemon=True).start()
+    
     # Run the MCP server using stdio transport (default for VS Code integration)
     mcp.run()
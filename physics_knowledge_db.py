@@ -5,19 +5,301 @@ A module for ingesting, storing, and querying physics knowledge from ArXiv paper
 using ChromaDB for vector storage and sentence-transformers for embeddings.
 """
 
+import atexit
+import functools
+import json
 import os
 import re
+import sys
 import tempfile
+import threading
 import requests
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List, Dict, Any, NamedTuple, Optional, Set, Tuple
 
 import arxiv
 import chromadb
 import fitz  # pymupdf
+import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
 
-# Regex pattern for GitHub repository URLs
-GITHUB_PATTERN = re.compile(r'https://github\.com/[\w\-]+/[\w\-]+')
+# Regex pattern for GitHub repository URLs; groups capture (user, repo)
+GITHUB_PATTERN = re.compile(r'https://github\.com/([\w\-]+)/([\w\-]+)')
+
+# Maximum number of concurrent downloads during a crawl
+MAX_DOWNLOAD_WORKERS = 8
+
+# Maximum number of chunks sent to ChromaDB in a single upsert call
+UPSERT_BATCH_SIZE = 5000
+
+# Largest PDF a crawl will download (bytes); larger files are skipped
+MAX_PDF_BYTES = 50 * 1024 * 1024
+
+# Fraction of the page height at the top and bottom treated as header/footer
+PAGE_MARGIN_FRACTION = 0.06
+
+# Blocks in the header/footer bands with this many words or fewer (page numbers,
+# running titles) are dropped; short blocks in the body, such as equations, are kept
+MIN_BLOCK_WORDS = 5
+
+
+def _chunk_words(words: List[str], chunk_size: int) -> List[str]:
+    """
+    Join consecutive runs of words into chunks.
+
+    Args:
+        words: Words to chunk (e.g. from str.split()).
+        chunk_size: Number of words per chunk.
+
+    Returns:
+        List of chunk strings; the last chunk may be shorter.
+    """
+    return [" ".join(words[i:i + chunk_size]) for i in range(0, len(words), chunk_size)]
+
+
+@functools.lru_cache(maxsize=4)
+def _load_model(
+    model_name: str,
+    device: Optional[str] = None,
+    dtype: Optional[str] = None,
+    compile_model: bool = False
+) -> SentenceTransformer:
+    """
+    Load a sentence-transformer model, sharing it across knowledge base instances.
+
+    Args:
+        model_name: Name of the sentence-transformer model to load.
+        device: Device for the model ('cuda', 'cpu', ...). Auto-detected if None.
+        dtype: Torch dtype name for the model weights ('float16', 'bfloat16', 'float32').
+            Defaults to float16 on CUDA and float32 elsewhere.
+        compile_model: Compile the transformer with torch.compile on CPU (slow first
+            encode, faster afterwards).
+
+    Returns:
+        The loaded SentenceTransformer.
+    """
+    print(f"Loading embedding model: {model_name}...", file=sys.stderr)
+    # SDPA lets attention dispatch to PyTorch's fused (flash / memory-efficient) kernels
+    model = SentenceTransformer(
+        model_name, device=device, model_kwargs={"attn_implementation": "sdpa"}
+    )
+    
+    # Half precision halves weight traffic and uses tensor cores on GPU
+    on_cuda = model.device.type == "cuda"
+    if dtype is None:
+        dtype = "float16" if on_cuda else "float32"
+    model = model.to(getattr(torch, dtype))
+    
+    if not on_cuda:
+        torch.set_num_threads(os.cpu_count() or 1)
+        
+        if compile_model:
+            # Sequence lengths vary per batch, so compile for dynamic shapes
+            transformer = model._first_module()
+            transformer.auto_model = torch.compile(transformer.auto_model, dynamic=True)
+    
+    print(f"Embedding model loaded successfully ({model.device}, {dtype}).", file=sys.stderr)
+    return model
+
+
+def _make_http_session() -> requests.Session:
+    """
+    Create an HTTP session that keeps connections alive across downloads.
+
+    Returns:
+        A requests.Session with a pooled adapter that retries rate-limited
+        (429) and unavailable (503) responses with exponential backoff.
+    """
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 503))
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry)
+    
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Paper metadata caches keyed by metadata file path, shared by every knowledge base
+# on the same db_path
+_paper_metadata_caches: Dict[str, Dict[str, Dict[str, str]]] = {}
+_paper_metadata_lock = threading.Lock()
+
+
+def _load_paper_metadata(meta_path: str) -> Dict[str, Dict[str, str]]:
+    """
+    Load paper metadata saved to disk.
+
+    Args:
+        meta_path: Path of the metadata JSON file.
+
+    Returns:
+        Dictionary mapping paper IDs to their metadata (empty if none was saved).
+    """
+    if not os.path.exists(meta_path):
+        return {}
+    
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading paper metadata: {e}", file=sys.stderr)
+        return {}
+
+
+def _save_paper_metadata(meta_path: str, metadata: Dict[str, Dict[str, str]]) -> None:
+    """
+    Merge paper metadata into the file on disk.
+
+    Entries saved by other processes since this one loaded the file are kept.
+
+    Args:
+        meta_path: Path of the metadata JSON file.
+        metadata: Paper metadata to add or update.
+    """
+    if not metadata:
+        return
+    
+    try:
+        merged = _load_paper_metadata(meta_path)
+        merged.update(metadata)
+        
+        # Write to a unique temporary file first so concurrent writers never share
+        # a file and a crash never leaves a truncated one
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(meta_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(merged, f)
+            os.replace(tmp_path, meta_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except Exception as e:
+        print(f"Error saving paper metadata: {e}")
+
+
+def _shared_paper_metadata(meta_path: str) -> Dict[str, Dict[str, str]]:
+    """
+    Get the in-memory paper metadata cache for a metadata file.
+
+    The first call for a path loads the file and registers a single exit hook that
+    saves the cache; later calls return the same dictionary.
+
+    Args:
+        meta_path: Absolute path of the metadata JSON file.
+
+    Returns:
+        Dictionary mapping paper IDs to their metadata.
+    """
+    with _paper_metadata_lock:
+        metadata = _paper_metadata_caches.get(meta_path)
+        if metadata is None:
+            metadata = _load_paper_metadata(meta_path)
+            _paper_metadata_caches[meta_path] = metadata
+            atexit.register(_save_paper_metadata, meta_path, metadata)
+        return metadata
+
+
+class KBResult(NamedTuple):
+    """A single query result with its citation metadata."""
+
+    text: str
+    source_id: str
+    title: str
+    page: int
+    url: str
+    distance: float
+
+
+class QueryResultColumns:
+    """
+    Query results stored column by column (one list per field, aligned by row).
+
+    Supports len() and slicing, so it can be truncated like a list of results
+    without materializing a dictionary per row.
+    """
+
+    __slots__ = ("texts", "source_ids", "titles", "pages", "urls", "distances")
+
+    def __init__(
+        self,
+        texts: List[str],
+        source_ids: List[str],
+        titles: List[str],
+        pages: List[int],
+        urls: List[str],
+        distances: np.ndarray
+    ):
+        """
+        Initialize the QueryResultColumns.
+
+        Args:
+            texts: Chunk texts.
+            source_ids: ArXiv paper IDs.
+            titles: Source titles.
+            pages: Page numbers (0 for GitHub content).
+            urls: Source URLs.
+            distances: Distances to the query as a NumPy array.
+        """
+        self.texts = texts
+        self.source_ids = source_ids
+        self.titles = titles
+        self.pages = pages
+        self.urls = urls
+        self.distances = distances
+
+    @classmethod
+    def empty(cls) -> "QueryResultColumns":
+        """Create an empty result set."""
+        return cls([], [], [], [], [], np.empty(0, dtype=np.float64))
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __getitem__(self, index: slice) -> "QueryResultColumns":
+        return QueryResultColumns(
+            self.texts[index],
+            self.source_ids[index],
+            self.titles[index],
+            self.pages[index],
+            self.urls[index],
+            self.distances[index]
+        )
+
+    def select(self, indices: List[int]) -> "QueryResultColumns":
+        """
+        Keep only the given rows.
+
+        Args:
+            indices: Row indices to keep, in output order.
+
+        Returns:
+            A new QueryResultColumns containing only those rows.
+        """
+        return QueryResultColumns(
+            [self.texts[i] for i in indices],
+            [self.source_ids[i] for i in indices],
+            [self.titles[i] for i in indices],
+            [self.pages[i] for i in indices],
+            [self.urls[i] for i in indices],
+            self.distances[indices]
+        )
+
+    def to_rows(self) -> List[KBResult]:
+        """
+        Convert to one KBResult per row.
+
+        Returns:
+            List of KBResult tuples.
+        """
+        return [
+            KBResult(text, source_id, title, page, url, float(distance))
+            for text, source_id, title, page, url, distance in zip(
+                self.texts, self.source_ids, self.titles, self.pages, self.urls, self.distances
+            )
+        ]
 
 
 class PhysicsKnowledgeBase:
@@ -29,30 +311,91 @@ class PhysicsKnowledgeBase:
     - Querying the knowledge base with citations
     """
 
-    def __init__(self, db_path: str = "./db", model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(
+        self,
+        db_path: str = "./db",
+        model_name: str = "all-MiniLM-L6-v2",
+        device: Optional[str] = None,
+        dtype: Optional[str] = None,
+        compile_model: bool = False,
+        max_pdf_bytes: int = MAX_PDF_BYTES,
+        hnsw_m: int = 24,
+        hnsw_construction_ef: int = 128,
+        hnsw_search_ef: int = 100,
+        hnsw_batch_size: int = 1000,
+        hnsw_sync_threshold: int = 10000
+    ):
         """
         Initialize the PhysicsKnowledgeBase.
 
         Args:
             db_path: Path for persistent ChromaDB storage.
             model_name: Name of the sentence-transformer model to use.
+            device: Device for the embedding model ('cuda', 'cpu', ...). Auto-detected if None.
+            dtype: Torch dtype name for the model weights ('float16', 'bfloat16', 'float32').
+                Defaults to float16 on CUDA and float32 elsewhere.
+            compile_model: Compile the embedding model with torch.compile (CPU only).
+            max_pdf_bytes: Largest PDF to download; bigger files are skipped.
+            hnsw_m: HNSW graph degree (links per node).
+            hnsw_construction_ef: HNSW candidate list size while building the index.
+            hnsw_search_ef: HNSW candidate list size at query time. Chroma has no
+                per-query override, so this applies to every query on the collection.
+            hnsw_batch_size: Number of vectors buffered before they are added to the index.
+            hnsw_sync_threshold: Number of vectors added before the index is persisted.
+                HNSW settings only take effect when the collection is first created.
         """
         # Initialize ChromaDB with persistent storage
         self.client = chromadb.PersistentClient(path=db_path)
         
-        # Get or create the collection for physics papers
-        self.collection = self.client.get_or_create_collection(
-            name="physics_papers",
-            metadata={"description": "Physics papers from ArXiv"}
-        )
+        # Get or create the collection for physics papers. HNSW settings are only passed
+        # on creation: get_or_create_collection would overwrite an existing collection's
+        # metadata, while its index keeps the settings it was built with.
+        try:
+            self.collection = self.client.get_collection(name="physics_papers")
+        except Exception:
+            self.collection = self.client.get_or_create_collection(
+                name="physics_papers",
+                metadata={
+                    "description": "Physics papers from ArXiv",
+                    # Embeddings are unit-length, so inner product ranks like cosine
+                    # without the per-distance normalization
+                    "hnsw:space": "ip",
+                    "hnsw:M": hnsw_m,
+                    "hnsw:construction_ef": hnsw_construction_ef,
+                    "hnsw:search_ef": hnsw_search_ef,
+                    "hnsw:batch_size": hnsw_batch_size,
+                    "hnsw:sync_threshold": hnsw_sync_threshold
+                }
+            )
+        
+        # The distance space is fixed at creation; older databases used l2/cosine on
+        # unnormalized embeddings and have to be rebuilt to get inner-product distances
+        space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        if space != "ip":
+            print(
+                f"⚠️ Collection 'physics_papers' uses '{space}' distance, not 'ip'. "
+                f"Delete '{db_path}' and crawl again to rebuild it with normalized embeddings.",
+                file=sys.stderr
+            )
+        
+        # Paper IDs already stored in the collection, loaded on first crawl
+        self._ingested_paper_ids: Optional[Set[str]] = None
+        
+        # Shared HTTP session so concurrent downloads reuse TLS connections
+        self._http = _make_http_session()
+        self.max_pdf_bytes = max_pdf_bytes
         
-        # Initialize the embedding model
-        print(f"Loading embedding model: {model_name}...")
-        self.embedding_model = SentenceTransformer(model_name)
-        print("Embedding model loaded successfully.")
+        # Initialize the embedding model (shared with other instances using the same settings)
+        self.embedding_model = _load_model(model_name, device, dtype, compile_model)
         
-        # Store paper metadata for reference lookup
-        self._paper_metadata: Dict[str, Dict[str, str]] = {}
+        # Store paper metadata for reference lookup, persisted next to the ChromaDB files.
+        # Instances on the same db_path share one dict, saved once at exit.
+        self._meta_path = os.path.abspath(os.path.join(db_path, "paper_metadata.json"))
+        self._paper_metadata = _shared_paper_metadata(self._meta_path)
+
+    def _save_metadata(self) -> None:
+        """Write cached paper metadata to disk so reference lookups survive restarts."""
+        _save_paper_metadata(self._meta_path, self._paper_metadata)
 
     def search_arxiv(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
         """
@@ -64,7 +407,7 @@ class PhysicsKnowledgeBase:
 
         Returns:
             List of dictionaries containing paper metadata:
-            {title, pdf_url, summary, paper_id}
+            {title, pdf_url, summary, paper_id, repo_url, repo_slug}
         """
         results = []
         
@@ -79,35 +422,40 @@ class PhysicsKnowledgeBase:
             # Fetch results
             client = arxiv.Client()
             for paper in client.results(search):
-                # Extract GitHub URL from abstract if present
-                github_match = GITHUB_PATTERN.search(paper.summary)
+                summary = paper.summary
+                
+                # Extract GitHub URL from abstract if present (skip the regex when it can't match)
+                github_match = GITHUB_PATTERN.search(summary) if "github.com" in summary else None
                 repo_url = github_match.group(0) if github_match else None
                 
-                paper_metadata = {
+                results.append({
                     "title": paper.title,
                     "pdf_url": paper.pdf_url,
-                    "summary": paper.summary,
+                    "summary": summary,
                     "paper_id": paper.get_short_id(),
-                    "repo_url": repo_url
-                }
-                results.append(paper_metadata)
-                
-                # Cache metadata for later reference
-                self._paper_metadata[paper.get_short_id()] = {
-                    "title": paper.title,
-                    "url": paper.pdf_url,
-                    "summary": paper.summary,
-                    "repo_url": repo_url
-                }
+                    "repo_url": repo_url,
+                    "repo_slug": github_match.groups() if github_match else None
+                })
                 
                 if repo_url:
                     print(f"  📦 Found GitHub repo: {repo_url}")
-                
+            
             print(f"Found {len(results)} papers for query: '{query}'")
             
         except Exception as e:
             print(f"Error searching ArXiv: {e}")
         
+        # Cache metadata for later reference, including partial results after an error
+        self._paper_metadata.update({
+            result["paper_id"]: {
+                "title": result["title"],
+                "url": result["pdf_url"],
+                "summary": result["summary"],
+                "repo_url": result["repo_url"]
+            }
+            for result in results
+        })
+        
         return results
 
     def read_paper(self, pdf_url: str, chunk_size: int = 500) -> List[Dict[str, Any]]:
@@ -122,51 +470,84 @@ class PhysicsKnowledgeBase:
             List of dictionaries containing:
             {text, page_number}
         """
-        chunks = []
+        pdf_bytes = self._fetch_pdf_bytes(pdf_url)
         
+        if pdf_bytes is None:
+            return []
+        
+        return self._parse_pdf(pdf_bytes, chunk_size=chunk_size)
+
+    def _fetch_pdf_bytes(self, pdf_url: str) -> Optional[bytes]:
+        """
+        Download a PDF.
+
+        Args:
+            pdf_url: URL to the PDF file.
+
+        Returns:
+            The PDF content, or None if the download failed or the file is
+            larger than max_pdf_bytes.
+        """
         try:
-            # Download PDF to a temporary file
             print(f"  Downloading PDF from: {pdf_url}")
-            response = requests.get(pdf_url, timeout=60)
-            response.raise_for_status()
-            
-            # Write to temporary file
-            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp_file:
-                tmp_file.write(response.content)
-                tmp_path = tmp_file.name
-            
-            try:
-                # Open PDF with pymupdf
-                doc = fitz.open(tmp_path)
+            with self._http.get(pdf_url, stream=True, timeout=60) as response:
+                response.raise_for_status()
+                
+                # Reject oversized files from the headers, before reading the body.
+                # A missing or malformed Content-Length counts as unknown.
+                content_length = response.headers.get("Content-Length", "").strip()
+                size = int(content_length) if content_length.isdigit() else 0
+                if size > self.max_pdf_bytes:
+                    print(f"  ⚠️ Skipping PDF ({size / 1e6:.1f} MB exceeds the size limit)")
+                    return None
                 
+                # Content-Length may be missing or wrong, so enforce the cap while reading
+                data = bytearray()
+                for block in response.iter_content(chunk_size=1 << 16):
+                    data.extend(block)
+                    if len(data) > self.max_pdf_bytes:
+                        print(f"  ⚠️ Skipping PDF (exceeds the size limit)")
+                        return None
+                
+                return bytes(data)
+            
+        except requests.RequestException as e:
+            print(f"  Error downloading PDF: {e}")
+        except Exception as e:
+            # Runs on a crawl worker; one bad download must only skip its own paper
+            print(f"  Unexpected error downloading PDF: {e}")
+        
+        return None
+
+    def _parse_pdf(self, pdf_bytes: bytes, chunk_size: int = 500) -> List[Dict[str, Any]]:
+        """
+        Extract text from PDF content, chunking it into smaller pieces.
+
+        Args:
+            pdf_bytes: The PDF file content.
+            chunk_size: Approximate number of words per chunk.
+
+        Returns:
+            List of dictionaries containing:
+            {text, page_number}
+        """
+        chunks = []
+        
+        try:
+            # Open the PDF straight from memory with pymupdf
+            with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
                 # Extract text from each page
                 for page_num in range(len(doc)):
-                    page = doc[page_num]
-                    text = page.get_text()
+                    text = self._page_body_text(doc[page_num])
                     
-                    if text.strip():
-                        # Split text into chunks by words
-                        words = text.split()
-                        
-                        for i in range(0, len(words), chunk_size):
-                            chunk_words = words[i:i + chunk_size]
-                            chunk_text = " ".join(chunk_words)
-                            
-                            if chunk_text.strip():
-                                chunks.append({
-                                    "text": chunk_text,
-                                    "page_number": page_num + 1  # 1-indexed
-                                })
+                    # Split text into chunks by words (1-indexed page numbers)
+                    chunks.extend(
+                        {"text": chunk_text, "page_number": page_num + 1}
+                        for chunk_text in _chunk_words(text.split(), chunk_size)
+                    )
                 
-                doc.close()
                 print(f"  Extracted {len(chunks)} chunks from {len(doc)} pages")
                 
-            finally:
-                # Clean up temporary file
-                os.unlink(tmp_path)
-                
-        except requests.RequestException as e:
-            print(f"  Error downloading PDF: {e}")
         except fitz.FileDataError as e:
             print(f"  Error reading PDF: {e}")
         except Exception as e:
@@ -174,12 +555,64 @@ class PhysicsKnowledgeBase:
         
         return chunks
 
-    def fetch_github_context(self, repo_url: str) -> Dict[str, str]:
+    @staticmethod
+    def _page_body_text(page: "fitz.Page") -> str:
+        """
+        Extract a page's body text, skipping short header and footer fragments.
+
+        Args:
+            page: A pymupdf page.
+
+        Returns:
+            The text of the remaining blocks, in document order.
+        """
+        height = page.rect.height
+        header_cutoff = height * PAGE_MARGIN_FRACTION
+        footer_cutoff = height * (1 - PAGE_MARGIN_FRACTION)
+        
+        # Each block is (x0, y0, x1, y1, text, block_no, block_type); type 1 is an image
+        return "\n".join(
+            block[4]
+            for block in page.get_text("blocks")
+            if block[6] == 0
+            and not (
+                (block[1] < header_cutoff or block[3] > footer_cutoff)
+                and len(block[4].split()) <= MIN_BLOCK_WORDS
+            )
+        )
+
+    def _get_text(self, url: str, timeout: int) -> Optional[str]:
+        """
+        Fetch a URL as text.
+
+        Args:
+            url: URL to fetch.
+            timeout: Request timeout in seconds.
+
+        Returns:
+            The response body, or None on a non-200 response or request error.
+        """
+        try:
+            response = self._http.get(url, timeout=timeout)
+            if response.status_code == 200:
+                return response.text
+        except requests.RequestException:
+            pass
+        
+        return None
+
+    def fetch_github_context(
+        self,
+        repo_url: str,
+        repo_slug: Optional[Tuple[str, str]] = None
+    ) -> Dict[str, str]:
         """
         Fetch README.md and requirements.txt from a GitHub repository.
 
         Args:
             repo_url: GitHub repository URL (e.g., https://github.com/user/repo)
+            repo_slug: Pre-parsed (user, repo) pair, as returned by search_arxiv.
+                Parsed from repo_url if None.
 
         Returns:
             Dictionary with {readme: str, requirements: str} content.
@@ -193,37 +626,42 @@ class PhysicsKnowledgeBase:
         # https://github.com/user/repo -> https://raw.githubusercontent.com/user/repo/main/
         try:
             # Extract user/repo from URL
-            parts = repo_url.replace("https://github.com/", "").split("/")
-            if len(parts) < 2:
-                return context
+            if repo_slug is None:
+                github_match = GITHUB_PATTERN.match(repo_url)
+                if not github_match:
+                    return context
+                repo_slug = github_match.groups()
             
-            user, repo = parts[0], parts[1]
+            user, repo = repo_slug
             raw_base = f"https://raw.githubusercontent.com/{user}/{repo}"
             
-            # Try to fetch README.md (try main branch first, then master)
+            # Request README.md and requirements.txt from both main and master at once
+            branches = ["main", "master"]
+            with ThreadPoolExecutor(max_workers=2 * len(branches)) as executor:
+                readme_futures = {
+                    branch: executor.submit(self._get_text, f"{raw_base}/{branch}/README.md", 15)
+                    for branch in branches
+                }
+                req_futures = {
+                    branch: executor.submit(self._get_text, f"{raw_base}/{branch}/requirements.txt", 10)
+                    for branch in branches
+                }
+            
+            # Prefer main over master; requirements.txt comes from the same branch as the README
             readme_fetched = False
-            for branch in ["main", "master"]:
-                readme_url = f"{raw_base}/{branch}/README.md"
-                try:
-                    response = requests.get(readme_url, timeout=15)
-                    if response.status_code == 200:
-                        context["readme"] = response.text
-                        readme_fetched = True
-                        print(f"  📖 Fetched README.md from {branch} branch")
-                        
-                        # Also try requirements.txt from same branch
-                        req_url = f"{raw_base}/{branch}/requirements.txt"
-                        try:
-                            req_response = requests.get(req_url, timeout=10)
-                            if req_response.status_code == 200:
-                                context["requirements"] = req_response.text
-                                print(f"  📦 Fetched requirements.txt")
-                        except requests.RequestException:
-                            pass
-                        
-                        break
-                except requests.RequestException:
-                    continue
+            for branch in branches:
+                readme = readme_futures[branch].result()
+                if readme is not None:
+                    context["readme"] = readme
+                    readme_fetched = True
+                    print(f"  📖 Fetched README.md from {branch} branch")
+                    
+                    requirements = req_futures[branch].result()
+                    if requirements is not None:
+                        context["requirements"] = requirements
+                        print(f"  📦 Fetched requirements.txt")
+                    
+                    break
             
             if not readme_fetched:
                 print(f"  ⚠️ Could not fetch README.md from {repo_url}")
@@ -233,7 +671,12 @@ class PhysicsKnowledgeBase:
         
         return context
 
-    def crawl_physics_knowledge(self, topic: str, max_papers: int = 5) -> int:
+    def crawl_physics_knowledge(
+        self,
+        topic: str,
+        max_papers: int = 5,
+        reingest: bool = False
+    ) -> int:
         """
         Main ingestion function: search ArXiv, download papers, and store in ChromaDB.
         Also fetches GitHub implementation details if available.
@@ -241,6 +684,8 @@ class PhysicsKnowledgeBase:
         Args:
             topic: Topic to search for on ArXiv.
             max_papers: Maximum number of papers to process.
+            reingest: Process papers even if they are already stored, overwriting their
+                chunks and embeddings (e.g. after changing the embedding model).
 
         Returns:
             Total number of chunks ingested.
@@ -258,8 +703,40 @@ class PhysicsKnowledgeBase:
             print("No papers found. Crawl complete.")
             return 0
         
-        # Process each paper
-        for idx, paper in enumerate(papers, 1):
+        # Skip papers that an earlier crawl already ingested
+        ingested = self._get_ingested_paper_ids()
+        if not reingest:
+            new_papers = [paper for paper in papers if paper["paper_id"] not in ingested]
+            
+            if len(new_papers) < len(papers):
+                print(f"\nSkipping {len(papers) - len(new_papers)} papers already in the database")
+            papers = new_papers
+        
+        if not papers:
+            print("No new papers to ingest. Crawl complete.")
+            return 0
+        
+        # Downloads are I/O-bound, so fetch every PDF and GitHub repo concurrently
+        print(f"\nDownloading {len(papers)} papers...")
+        with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as executor:
+            pdf_futures = [
+                executor.submit(self._fetch_pdf_bytes, paper["pdf_url"])
+                for paper in papers
+            ]
+            github_futures = [
+                executor.submit(self.fetch_github_context, paper["repo_url"], paper.get("repo_slug"))
+                if paper.get("repo_url") else None
+                for paper in papers
+            ]
+        
+        # Pass 1: chunk every paper (and its GitHub repo) into flat, aligned lists
+        all_ids: List[str] = []
+        all_documents: List[str] = []
+        all_metadatas: List[Dict[str, Any]] = []
+        
+        for idx, (paper, pdf_future, github_future) in enumerate(
+            zip(papers, pdf_futures, github_futures), 1
+        ):
             paper_id = paper["paper_id"]
             title = paper["title"]
             pdf_url = paper["pdf_url"]
@@ -269,108 +746,102 @@ class PhysicsKnowledgeBase:
             print(f"  Paper ID: {paper_id}")
             
             # Read and chunk the paper
-            chunks = self.read_paper(pdf_url)
+            pdf_bytes = pdf_future.result()
+            chunks = self._parse_pdf(pdf_bytes) if pdf_bytes is not None else []
             
             if not chunks:
                 print(f"  Skipping paper (no chunks extracted)")
                 continue
             
             # Prepare data for ChromaDB - Paper content
-            documents = []
-            metadatas = []
-            ids = []
-            
             for chunk_idx, chunk in enumerate(chunks):
                 # Generate unique ID for each chunk
-                chunk_id = f"{paper_id}_chunk_{chunk_idx}"
-                
-                documents.append(chunk["text"])
-                metadatas.append({
+                all_ids.append(f"{paper_id}_chunk_{chunk_idx}")
+                all_documents.append(chunk["text"])
+                all_metadatas.append({
                     "source_id": paper_id,
                     "title": title,
                     "page": chunk["page_number"],
                     "url": pdf_url,
                     "type": "paper_content"
                 })
-                ids.append(chunk_id)
             
-            # Generate embeddings for paper content
-            print(f"  Generating embeddings for {len(documents)} paper chunks...")
-            embeddings = self.embedding_model.encode(documents).tolist()
+            print(f"  Prepared {len(chunks)} paper chunks")
             
-            # Store paper content in ChromaDB
-            try:
-                self.collection.upsert(
-                    ids=ids,
-                    documents=documents,
-                    embeddings=embeddings,
-                    metadatas=metadatas
-                )
-                total_chunks += len(documents)
-                print(f"  ✅ Stored {len(documents)} paper chunks")
-                
-            except Exception as e:
-                print(f"  Error storing chunks in ChromaDB: {e}")
-            
-            # Fetch and store GitHub implementation details if available
-            if repo_url:
-                print(f"  🔗 Fetching GitHub implementation details...")
-                github_context = self.fetch_github_context(repo_url)
-                
-                github_documents = []
-                github_metadatas = []
-                github_ids = []
+            # Fetch GitHub implementation details if available
+            if github_future is not None:
+                print(f"  🔗 Adding GitHub implementation details...")
+                github_context = github_future.result()
+                github_count = 0
                 
                 # Process README content
                 if github_context["readme"]:
                     # Chunk the README (500 words per chunk)
-                    readme_words = github_context["readme"].split()
-                    chunk_size = 500
+                    readme_chunks = _chunk_words(github_context["readme"].split(), 500)
                     
-                    for i in range(0, len(readme_words), chunk_size):
-                        chunk_words = readme_words[i:i + chunk_size]
-                        chunk_text = " ".join(chunk_words)
-                        
-                        if chunk_text.strip():
-                            github_documents.append(chunk_text)
-                            github_metadatas.append({
-                                "source_id": paper_id,
-                                "title": f"{title} - GitHub README",
-                                "page": 0,
-                                "url": repo_url,
-                                "type": "implementation_details"
-                            })
-                            github_ids.append(f"{paper_id}_github_readme_{i // chunk_size}")
+                    for chunk_idx, chunk_text in enumerate(readme_chunks):
+                        all_ids.append(f"{paper_id}_github_readme_{chunk_idx}")
+                        all_documents.append(chunk_text)
+                        all_metadatas.append({
+                            "source_id": paper_id,
+                            "title": f"{title} - GitHub README",
+                            "page": 0,
+                            "url": repo_url,
+                            "type": "implementation_details"
+                        })
+                    github_count += len(readme_chunks)
                 
                 # Process requirements.txt
                 if github_context["requirements"]:
-                    github_documents.append(f"Dependencies and requirements: {github_context['requirements']}")
-                    github_metadatas.append({
+                    all_ids.append(f"{paper_id}_github_requirements")
+                    all_documents.append(f"Dependencies and requirements: {github_context['requirements']}")
+                    all_metadatas.append({
                         "source_id": paper_id,
                         "title": f"{title} - Dependencies",
                         "page": 0,
                         "url": repo_url,
                         "type": "implementation_details"
                     })
-                    github_ids.append(f"{paper_id}_github_requirements")
+                    github_count += 1
+                
+                if github_count:
+                    print(f"  Prepared {github_count} implementation chunks")
+        
+        # Pass 2: embed every chunk in a single encode call, then upsert in large batches
+        if all_documents:
+            print(f"\nGenerating embeddings for {len(all_documents)} chunks...")
+            all_embeddings = self._encode(all_documents, batch_size=64, show_progress_bar=True)
+            
+            # Re-ingested papers may now produce fewer chunks (or a shorter README), so
+            # remove everything stored for them first; upserting alone would leave the
+            # old trailing chunks in place
+            stale_ids = sorted({meta["source_id"] for meta in all_metadatas} & ingested)
+            if reingest and stale_ids:
+                try:
+                    self.collection.delete(where={"source_id": {"$in": stale_ids}})
+                    print(f"  🗑️ Removed previous chunks of {len(stale_ids)} re-ingested papers")
+                except Exception as e:
+                    print(f"  Error removing previous chunks from ChromaDB: {e}")
+            
+            for start in range(0, len(all_ids), UPSERT_BATCH_SIZE):
+                end = start + UPSERT_BATCH_SIZE
                 
-                # Store GitHub content if we have any
-                if github_documents:
-                    print(f"  Generating embeddings for {len(github_documents)} GitHub chunks...")
-                    github_embeddings = self.embedding_model.encode(github_documents).tolist()
+                try:
+                    self.collection.upsert(
+                        ids=all_ids[start:end],
+                        documents=all_documents[start:end],
+                        embeddings=all_embeddings[start:end],
+                        metadatas=all_metadatas[start:end]
+                    )
+                    stored = min(end, len(all_ids)) - start
+                    total_chunks += stored
+                    ingested.update(meta["source_id"] for meta in all_metadatas[start:end])
+                    print(f"  ✅ Stored {stored} chunks")
                     
-                    try:
-                        self.collection.upsert(
-                            ids=github_ids,
-                            documents=github_documents,
-                            embeddings=github_embeddings,
-                            metadatas=github_metadatas
-                        )
-                        total_chunks += len(github_documents)
-                        print(f"  ✅ Stored {len(github_documents)} implementation chunks")
-                        
-                    except Exception as e:
-                        print(f"  Error storing GitHub chunks: {e}")
+                except Exception as e:
+                    print(f"  Error storing chunks in ChromaDB: {e}")
+        
+        self._save_metadata()
         
         print(f"\n{'='*60}")
         print(f"Crawl complete! Total chunks ingested: {total_chunks}")
@@ -378,53 +849,205 @@ class PhysicsKnowledgeBase:
         
         return total_chunks
 
-    def query_physics_db(self, question: str, n_results: int = 3) -> List[Dict[str, Any]]:
+    def _get_ingested_paper_ids(self) -> Set[str]:
+        """
+        Get the IDs of papers whose content is already stored in the collection.
+
+        The set is built from the stored chunk IDs ({paper_id}_chunk_{n}) on first use
+        and kept up to date by crawl_physics_knowledge afterwards.
+
+        Returns:
+            Set of ArXiv paper IDs.
+        """
+        if self._ingested_paper_ids is None:
+            try:
+                chunk_ids = self.collection.get(include=[])["ids"]
+                self._ingested_paper_ids = {
+                    chunk_id.rsplit("_chunk_", 1)[0]
+                    for chunk_id in chunk_ids
+                    if "_chunk_" in chunk_id
+                }
+            except Exception as e:
+                print(f"Error loading stored paper IDs: {e}")
+                return set()
+        
+        return self._ingested_paper_ids
+
+    def _encode(self, texts: List[str], **kwargs: Any) -> np.ndarray:
+        """
+        Encode texts into unit-length float32 embeddings.
+
+        Half-precision models produce (and sentence-transformers normalizes) half-precision
+        outputs, so the embeddings are upcast first and then re-normalized in float32.
+
+        Args:
+            texts: Texts to encode.
+            **kwargs: Extra arguments for SentenceTransformer.encode.
+
+        Returns:
+            NumPy array of shape (len(texts), embedding_dim).
+        """
+        embeddings = np.asarray(
+            self.embedding_model.encode(texts, convert_to_numpy=True, **kwargs),
+            dtype=np.float32
+        )
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms > 0.0, norms, 1.0)
+
+    def embed_queries(self, questions: List[str]) -> Any:
+        """
+        Embed query strings with the knowledge base's embedding model.
+
+        Args:
+            questions: List of query strings.
+
+        Returns:
+            NumPy array of unit-length embeddings, shape (len(questions), embedding_dim).
+        """
+        return self._encode(questions)
+
+    def query_physics_db(
+        self,
+        question: str,
+        n_results: int = 3,
+        query_embedding: Optional[Any] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[KBResult]:
         """
         Query the knowledge base for relevant information.
 
         Args:
             question: The question to search for.
             n_results: Number of results to return.
+            query_embedding: Precomputed embedding for the question (skips re-encoding).
+            where: Optional ChromaDB metadata filter (e.g. {"type": "implementation_details"}).
 
         Returns:
-            List of dictionaries containing:
-            {text, source_id, title, page, url, distance}
+            List of KBResult tuples:
+            (text, source_id, title, page, url, distance)
+
+            Embeddings are unit-length and compared by inner product, so distance is
+            1 - cosine similarity (0 = identical); use 1 - distance as a similarity score.
+            Precomputed query embeddings must come from embed_queries to stay comparable.
         """
-        results = []
+        query_embeddings = None if query_embedding is None else [query_embedding]
+        return self.query_physics_db_batch(
+            [question], n_results=n_results, query_embeddings=query_embeddings, where=where
+        )[0]
+
+    def query_physics_db_batch(
+        self,
+        questions: List[str],
+        n_results: int = 3,
+        query_embeddings: Optional[Any] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[List[KBResult]]:
+        """
+        Query the knowledge base for several questions with a single embedding
+        pass and a single ChromaDB query.
+
+        Args:
+            questions: The questions to search for.
+            n_results: Number of results to return per question.
+            query_embeddings: Precomputed embeddings, one per question (skips re-encoding).
+            where: Optional ChromaDB metadata filter applied to every question.
+
+        Returns:
+            One list of KBResult tuples per question.
+        """
+        return [
+            columns.to_rows()
+            for columns in self.query_physics_db_soa_batch(
+                questions, n_results=n_results, query_embeddings=query_embeddings, where=where
+            )
+        ]
+
+    def query_physics_db_soa(
+        self,
+        question: str,
+        n_results: int = 3,
+        query_embedding: Optional[Any] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> "QueryResultColumns":
+        """
+        Query the knowledge base, returning the results column by column.
+
+        Args:
+            question: The question to search for.
+            n_results: Number of results to return.
+            query_embedding: Precomputed embedding for the question (skips re-encoding).
+            where: Optional ChromaDB metadata filter.
+
+        Returns:
+            QueryResultColumns with one list per field.
+        """
+        query_embeddings = None if query_embedding is None else [query_embedding]
+        return self.query_physics_db_soa_batch(
+            [question], n_results=n_results, query_embeddings=query_embeddings, where=where
+        )[0]
+
+    def query_physics_db_soa_batch(
+        self,
+        questions: List[str],
+        n_results: int = 3,
+        query_embeddings: Optional[Any] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List["QueryResultColumns"]:
+        """
+        Query the knowledge base for several questions with a single embedding
+        pass and a single ChromaDB query, returning the results column by column.
+
+        Args:
+            questions: The questions to search for.
+            n_results: Number of results to return per question.
+            query_embeddings: Precomputed embeddings, one per question (skips re-encoding).
+            where: Optional ChromaDB metadata filter applied to every question.
+
+        Returns:
+            One QueryResultColumns per question.
+        """
+        all_results = [QueryResultColumns.empty() for _ in questions]
+        
+        if not questions:
+            return all_results
         
         try:
-            # Generate embedding for the question
-            question_embedding = self.embedding_model.encode([question]).tolist()
+            # Generate embeddings for all questions in one forward pass
+            if query_embeddings is None:
+                query_embeddings = self._encode(questions, batch_size=len(questions))
+            question_embeddings = np.asarray(query_embeddings, dtype=np.float32)
             
-            # Query ChromaDB
+            # Query ChromaDB once for every question
             query_results = self.collection.query(
-                query_embeddings=question_embedding,
+                query_embeddings=question_embeddings,
                 n_results=n_results,
+                where=where,
                 include=["documents", "metadatas", "distances"]
             )
             
-            # Format results
+            # Split results back out per question, projecting metadata into columns
             if query_results and query_results["documents"]:
-                documents = query_results["documents"][0]
-                metadatas = query_results["metadatas"][0]
-                distances = query_results["distances"][0]
-                
-                for doc, meta, dist in zip(documents, metadatas, distances):
-                    results.append({
-                        "text": doc,
-                        "source_id": meta.get("source_id", "Unknown"),
-                        "title": meta.get("title", "Unknown"),
-                        "page": meta.get("page", 0),
-                        "url": meta.get("url", ""),
-                        "distance": dist
-                    })
+                for idx, (documents, metadatas, distances) in enumerate(zip(
+                    query_results["documents"],
+                    query_results["metadatas"],
+                    query_results["distances"]
+                )):
+                    all_results[idx] = QueryResultColumns(
+                        texts=documents,
+                        source_ids=[meta.get("source_id", "Unknown") for meta in metadatas],
+                        titles=[meta.get("title", "Unknown") for meta in metadatas],
+                        pages=[meta.get("page", 0) for meta in metadatas],
+                        urls=[meta.get("url", "") for meta in metadatas],
+                        distances=np.asarray(distances, dtype=np.float64)
+                    )
             
-            print(f"Found {len(results)} relevant chunks for: '{question}'")
+            for question, results in zip(questions, all_results):
+                print(f"Found {len(results)} relevant chunks for: '{question}'")
             
         except Exception as e:
             print(f"Error querying database: {e}")
         
-        return results
+        return all_results
 
     def get_reference(self, paper_id: str) -> Optional[Dict[str, str]]:
         """
@@ -503,12 +1126,12 @@ if __name__ == "__main__":
     
     print("\n--- Query Results ---")
     for i, result in enumerate(results, 1):
-        print(f"\n[{i}] Source: {result['source_id']}, Page: {result['page']}")
-        print(f"    Title: {result['title'][:50]}...")
-        print(f"    Text: {result['text'][:200]}...")
+        print(f"\n[{i}] Source: {result.source_id}, Page: {result.page}")
+        print(f"    Title: {result.title[:50]}...")
+        print(f"    Text: {result.text[:200]}...")
         
         # Get full reference
-        ref = kb.get_reference(result['source_id'])
+        ref = kb.get_reference(result.source_id)
         if ref:
             print(f"    Reference: {ref['title']}")
     
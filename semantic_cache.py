@@ -0,0 +1,349 @@
+"""
+Semantic Query Cache Module
+
+An in-process LRU + TTL cache for knowledge base queries. Lookups first try a
+cheap normalized-text key and, on a miss, fall back to comparing the query
+embedding against every cached query embedding with cosine similarity.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Collapses runs of whitespace when normalizing query text
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+class SemanticQueryCache:
+    """
+    A thread-safe cache for query results that supports:
+    - Exact hits on normalized query text
+    - Semantic hits on near-identical queries (cosine similarity >= threshold)
+    - LRU eviction once max_size entries are stored
+    - Per-entry time-to-live expiry
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], np.ndarray],
+        max_size: int = 2000,
+        ttl_seconds: float = 3600.0,
+        similarity_threshold: float = 0.95
+    ):
+        """
+        Initialize the SemanticQueryCache.
+
+        Args:
+            embed_fn: Callable that embeds a list of query strings into an (N, D) array.
+            max_size: Maximum number of cached queries before LRU eviction.
+            ttl_seconds: Seconds a cached result stays valid.
+            similarity_threshold: Minimum cosine similarity for a semantic hit.
+        """
+        self._embed_fn = embed_fn
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        self._lock = threading.RLock()
+
+        # key -> (query_text, row, scope, results, expire_ts), in LRU order.
+        # A scope identifies the (n_results, where filter) pair a result was computed for.
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, int, str, Any, float]]" = OrderedDict()
+
+        # Integer bucket ids for the scopes of matrix rows, so rows can be masked by
+        # scope with one vectorized comparison. Ids are released with their last row.
+        self._bucket_ids: Dict[str, int] = {}
+        self._bucket_rows: Dict[str, int] = {}
+        self._next_bucket_id = 0
+
+        # Unit-length embeddings live in one contiguous float32 matrix; entries point at
+        # their row. Pre-normalizing makes cosine similarity a single matrix-vector product.
+        self._matrix: Optional[np.ndarray] = None
+        self._expire: Optional[np.ndarray] = None
+        self._row_buckets: Optional[np.ndarray] = None
+        self._row_keys: List[Optional[Tuple[str, str]]] = []
+        self._free_rows: List[int] = []
+
+        # Bumped by clear(); results computed before a clear are never stored
+        self._generation = 0
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(query: str) -> str:
+        """Build the exact-match key text for a query."""
+        return _WHITESPACE_PATTERN.sub(" ", query).strip().lower()
+
+    @staticmethod
+    def _scope(n_results: int, where: Optional[Dict[str, Any]]) -> str:
+        """Build the key part identifying an (n_results, where filter) pair."""
+        return f"{n_results}|{json.dumps(where, sort_keys=True) if where else ''}"
+
+    def _acquire_bucket(self, scope: str) -> int:
+        """Return the bucket id for a scope, counting one more matrix row in it."""
+        bucket = self._bucket_ids.get(scope)
+        if bucket is None:
+            bucket = self._next_bucket_id
+            self._next_bucket_id += 1
+            self._bucket_ids[scope] = bucket
+            self._bucket_rows[scope] = 0
+        self._bucket_rows[scope] += 1
+        return bucket
+
+    def _release_bucket(self, scope: str) -> None:
+        """Count one fewer matrix row in a scope, forgetting its id after the last one."""
+        self._bucket_rows[scope] -= 1
+        if not self._bucket_rows[scope]:
+            del self._bucket_rows[scope]
+            del self._bucket_ids[scope]
+
+    def get_or_compute(
+        self,
+        query: str,
+        n_results: int,
+        compute: Callable[[np.ndarray], Any],
+        where: Optional[Dict[str, Any]] = None,
+        semantic: bool = True
+    ) -> Any:
+        """
+        Return cached results for a query, computing and storing them on a miss.
+
+        Args:
+            query: The query text.
+            n_results: Number of results requested (part of the cache key).
+            compute: Callable that receives the query embedding and returns the results.
+            where: Metadata filter the results were computed with (part of the cache key).
+            semantic: Whether near-identical queries may be served from the cache.
+
+        Returns:
+            The cached or freshly computed results.
+        """
+        return self.get_or_compute_many(
+            [query],
+            n_results,
+            lambda queries, embeddings: [compute(embeddings[0])],
+            where=where,
+            semantic=semantic
+        )[0]
+
+    def get_or_compute_many(
+        self,
+        queries: List[str],
+        n_results: int,
+        compute: Callable[[List[str], np.ndarray], List[Any]],
+        where: Optional[Dict[str, Any]] = None,
+        semantic: bool = True,
+        embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None
+    ) -> List[Any]:
+        """
+        Return cached results for several queries, computing all misses in one call.
+
+        Args:
+            queries: The query texts.
+            n_results: Number of results requested per query (part of the cache key).
+            compute: Callable that receives the missed queries and their (M, D) embeddings
+                and returns one result set per missed query.
+            where: Metadata filter the results were computed with (part of the cache key).
+            semantic: Whether near-identical queries may be served from the cache. Use
+                False for templated queries where a small text difference (such as a
+                paper ID) changes the meaning; their entries are exact-match only.
+            embed_fn: Embedding function to use for this call instead of the cache's own
+                (e.g. one that reuses embeddings computed earlier in the same request).
+
+        Returns:
+            One result set per query, in input order.
+        """
+        scope = self._scope(n_results, where)
+        keys = [(self._normalize(query), scope) for query in queries]
+        results: List[Any] = [None] * len(queries)
+
+        with self._lock:
+            generation = self._generation
+            for i, key in enumerate(keys):
+                results[i] = self._lookup_exact(key)
+
+        pending = [i for i, cached in enumerate(results) if cached is None]
+        if not pending:
+            return results
+
+        # Embed all pending queries in one pass, outside the lock. compute gets the raw
+        # embeddings; the cache itself only ever compares unit-length copies.
+        embed_fn = embed_fn or self._embed_fn
+        embeddings = np.asarray(embed_fn([queries[i] for i in pending]), dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        unit_embeddings = embeddings / np.where(norms > 0.0, norms, 1.0)
+
+        missed = []
+        with self._lock:
+            for row, i in enumerate(pending):
+                if semantic:
+                    results[i] = self._lookup_similar(unit_embeddings[row], scope)
+                if results[i] is None:
+                    missed.append(row)
+            self.misses += len(missed)
+
+        if not missed:
+            return results
+
+        computed = compute([queries[pending[row]] for row in missed], embeddings[missed])
+
+        with self._lock:
+            # A clear() while computing means these results may predate new data
+            store = self._generation == generation
+            for row, query_results in zip(missed, computed):
+                i = pending[row]
+                results[i] = query_results
+                # Don't pin empty result sets; the collection may simply not be populated yet
+                if store and query_results:
+                    self._store(
+                        keys[i],
+                        queries[i],
+                        unit_embeddings[row] if semantic else None,
+                        scope,
+                        query_results
+                    )
+
+        return results
+
+    def _lookup_exact(self, key: Tuple[str, str]) -> Optional[Any]:
+        """Return results for an exact key hit, or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if entry[4] <= time.time():
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[3]
+
+    def _lookup_similar(self, unit_embedding: np.ndarray, scope: str) -> Optional[Any]:
+        """Return results for the most similar live entry above threshold, or None."""
+        bucket = self._bucket_ids.get(scope)
+        if bucket is None:
+            return None
+
+        used = len(self._row_keys)
+
+        # Cosine similarity against every cached row: one BLAS sgemv on unit vectors
+        sims = self._matrix[:used] @ unit_embedding
+
+        # Rows that are free, expired, or from a different scope never match
+        valid = (self._expire[:used] > time.time()) & (self._row_buckets[:used] == bucket)
+        sims = np.where(valid, sims, -np.inf)
+
+        row = int(np.argmax(sims))
+        if sims[row] < self.similarity_threshold:
+            return None
+
+        key = self._row_keys[row]
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.semantic_hits += 1
+        return self._entries[key][3]
+
+    def _store(
+        self,
+        key: Tuple[str, str],
+        query: str,
+        unit_embedding: Optional[np.ndarray],
+        scope: str,
+        results: Any
+    ) -> None:
+        """
+        Insert or refresh an entry, evicting the least recently used one if full.
+
+        Entries stored without an embedding get no matrix row (row -1), so they
+        only ever serve exact hits.
+        """
+        if key in self._entries:
+            self._remove(key)
+
+        while len(self._entries) >= self.max_size:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+
+        expire_ts = time.time() + self.ttl_seconds
+        row = -1
+
+        if unit_embedding is not None:
+            row = self._allocate_row(unit_embedding.shape[0])
+            self._matrix[row] = unit_embedding
+            self._expire[row] = expire_ts
+            self._row_buckets[row] = self._acquire_bucket(scope)
+            self._row_keys[row] = key
+
+        self._entries[key] = (query, row, scope, results, expire_ts)
+
+    def _allocate_row(self, dim: int) -> int:
+        """Return a free matrix row, growing the matrix geometrically when needed."""
+        if self._free_rows:
+            return self._free_rows.pop()
+
+        if self._matrix is None:
+            capacity = min(64, self.max_size)
+            self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+            self._expire = np.zeros(capacity, dtype=np.float64)
+            self._row_buckets = np.full(capacity, -1, dtype=np.int64)
+
+        row = len(self._row_keys)
+        if row >= self._matrix.shape[0]:
+            capacity = min(self._matrix.shape[0] * 2, self.max_size)
+            self._matrix = np.resize(self._matrix, (capacity, dim))
+            self._expire = np.resize(self._expire, capacity)
+            self._row_buckets = np.resize(self._row_buckets, capacity)
+
+        self._row_keys.append(None)
+        return row
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        """Drop an entry and release its matrix row."""
+        entry = self._entries.pop(key)
+        row = entry[1]
+        if row < 0:
+            return
+
+        self._expire[row] = 0.0
+        self._row_buckets[row] = -1
+        self._row_keys[row] = None
+        self._release_bucket(entry[2])
+        self._free_rows.append(row)
+
+    def clear(self) -> None:
+        """Invalidate every cached entry (e.g. after new papers are ingested)."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bucket_ids = {}
+            self._bucket_rows = {}
+            self._matrix = None
+            self._expire = None
+            self._row_buckets = None
+            self._row_keys = []
+            self._free_rows = []
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get statistics about the cache.
+
+        Returns:
+            Dictionary with cache size and hit/miss counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
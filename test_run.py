@@ -42,14 +42,14 @@ def main():
         print("   No results found.")
     else:
         for i, result in enumerate(results, 1):
-            print(f"\n[{i}] Source: {result['source_id']}")
-            print(f"    Title: {result['title'][:60]}...")
-            print(f"    Page: {result['page']}")
-            print(f"    Relevance: {1 - result['distance']:.3f}")
-            print(f"    Text: {result['text'][:200]}...")
+            print(f"\n[{i}] Source: {result.source_id}")
+            print(f"    Title: {result.title[:60]}...")
+            print(f"    Page: {result.page}")
+            print(f"    Relevance: {1 - result.distance:.3f}")
+            print(f"    Text: {result.text[:200]}...")
             
             # Verify the reference
-            ref = kb.get_reference(result['source_id'])
+            ref = kb.get_reference(result.source_id)
             if ref:
                 print(f"    📄 Citation: {ref['title']}")
                 print(f"    🔗 URL: {ref['url']}")